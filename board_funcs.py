@@ -0,0 +1,29 @@
+
+from collections import namedtuple
+
+
+class BoardFuncs(namedtuple('BoardFuncs', ['is_ended', 'next_state', 'legal_actions', 'current_player',
+                                           'points_values', 'owned_boxes', 'box_closed_by', 'as_array'])):
+    """ The board methods used by a search, looked up once so the hot loops do not resolve them on the board for
+    every call. Optional methods the board does not provide are None.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def bind(cls, board):
+        """ Binds the methods of a board.
+
+        Args:
+            board:  The game setup.
+
+        Returns:    The bound methods.
+
+        """
+        return cls(is_ended=board.is_ended,
+                   next_state=board.next_state,
+                   legal_actions=board.legal_actions,
+                   current_player=board.current_player,
+                   points_values=board.points_values,
+                   owned_boxes=getattr(board, 'owned_boxes', None),
+                   box_closed_by=getattr(board, 'box_closed_by', None),
+                   as_array=getattr(board, 'as_array', None))
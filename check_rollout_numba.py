@@ -0,0 +1,52 @@
+import sys
+import random
+import p3_t3
+from rollout_numba import legal_actions_nb, next_state_nb, is_ended_nb, points_nb, _closes_box
+
+# Plays random games and checks that rollout_numba agrees with p3_t3.Board on every state along the way.
+# Run as: python check_rollout_numba.py [games]
+
+def encode(action):
+    R, C, r, c = action
+    return 9 * (3 * R + C) + 3 * r + c
+
+board = p3_t3.Board()
+games = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+mismatches = 0
+
+for game in range(games):
+    state = board.starting_state()
+    while True:
+        array = board.as_array(state)
+        if is_ended_nb(array) != board.is_ended(state):
+            mismatches += 1
+            print("is_ended differs on", state)
+
+        if board.is_ended(state):
+            points = points_nb(array)
+            if (points[1], points[2]) != (board.points_values(state)[1], board.points_values(state)[2]):
+                mismatches += 1
+                print("points differ on", state)
+            break
+
+        actions = board.legal_actions(state)
+        if [encode(action) for action in actions] != list(legal_actions_nb(array)):
+            mismatches += 1
+            print("legal actions differ on", state)
+
+        for action in actions:
+            for player in (1, 2):
+                expected = board.current_player(state) == player and board.box_closed_by(state, action)
+                if _closes_box(array, encode(action), player) != expected:
+                    mismatches += 1
+                    print("box_closed_by differs on", state, action)
+
+        action = random.choice(actions)
+        next_state = board.next_state(state, action)
+        if not (next_state_nb(array, encode(action)) == board.as_array(next_state)).all():
+            mismatches += 1
+            print("next_state differs on", state, action)
+        state = next_state
+
+print("%d games checked, %d mismatches" % (games, mismatches))
+exit(1 if mismatches else 0)
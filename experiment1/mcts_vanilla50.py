@@ -1,10 +1,47 @@
 
-from mcts_node import MCTSNode
+from mcts_node import NodePool
+from board_funcs import BoardFuncs
 from random import choice
-from math import sqrt, log
+from math import log
+from multiprocessing import cpu_count, get_all_start_methods, get_context
+import random
+
+# NumPy and Numba are optional, e.g. under PyPy: the bots then use their pure-Python UCT loop and rollouts
+try:
+    import numpy as np
+    from numba import config as numba_config, set_num_threads
+
+    # The batch rollouts run in the worker processes think forks. Once TBB's threads have started, a forked
+    # process hangs on exit, so unless NUMBA_THREADING_LAYER picks one the parallel loops use Numba's own
+    # workqueue layer (each process only calls them from one thread).
+    if numba_config.THREADING_LAYER == 'default':
+        numba_config.THREADING_LAYER = 'workqueue'
+    from rollout_numba import simulate_random, batch_random
+except ImportError:
+    np = None
+    set_num_threads = None
+    simulate_random = None
+    batch_random = None
 
 num_nodes = 50
 explore_faction = 2.
+num_processes = cpu_count()
+min_shard_size = 200        # Fewest simulations given to one worker's tree
+rollout_batch = 4           # Rollouts played out from each expanded leaf
+vector_min_children = 20    # Below this many children the plain loop beats NumPy's call overhead
+min_leaf_batch = 4          # Fewest leaves whose rollouts are played out together in one compiled call
+min_rounds = 8              # Fewest rounds of leaves per tree, so most leaves are picked from real results
+
+# Visit counts stay small, so their logarithms are looked up instead of computed
+LOG_TABLE = [0.0] + [log(i) for i in range(1, 4096)]
+
+# Process count -> worker pool of think, started on first use and kept for the following moves
+worker_pools = {}
+
+def _get_worker_pool(processes):
+    if processes not in worker_pools:
+        worker_pools[processes] = get_context('fork').Pool(processes=processes)
+    return worker_pools[processes]
 
 def traverse_nodes(node, board, state, identity):
     """ Traverses the tree until the end criterion are met.
@@ -12,43 +49,62 @@ def traverse_nodes(node, board, state, identity):
     Args:
         node:       A tree node from which the search is traversing.
         state:      The state of the game.
-        identity:   The bot's identity, either 'red' or 'blue'.
+        identity:   The bot's player number, 1 or 2.
 
-    Returns:        A node from which the next stage of the search can proceed.
+    Returns:        A node from which the next stage of the search can proceed, its state and the path of nodes
+                    from the given node down to it.
 
     """
-    current = node
+    _ended = board.is_ended
+    _player = board.current_player
+
+    pool = node.pool
+    wins, visits = pool.wins, pool.visits
+    current = node.id
     current_state = state
+    path = [current]
 
     # Loop through nodes in tree
-    while not board.is_ended(current_state):
+    while not _ended(current_state):
         # If there are untried actions we quit the loop
-        if current.untried_actions != []:
+        if pool.untried_actions[current] != []:
             break
         else:
             # Otherwise we descend through the tree
-            best_UCT = 0
-            best_children = []
-
-            for key, child in current.child_nodes.items():
-                # Calculate UCT factor for child
-                exploit_term = child.wins / float(child.visits)
-                explore_term = explore_faction * sqrt(log(current.visits) / child.visits)
-
-                child_UCT = (exploit_term if board.current_player(current_state) == identity else (1 - exploit_term)) + explore_term
-
-                # Update best_children list
-                if child_UCT == best_UCT:
-                    best_children.append(child)
-                elif child_UCT > best_UCT:
-                    best_children = [child]
-                    best_UCT = child_UCT
-
-            current = choice(best_children)
-            current_state = board.next_state(current_state, current.parent_action)
+            is_my_turn = (_player(current_state) == identity)
+            child_ids = pool.child_ids[current]
+            parent_visits = visits[current]
+            log_visits = LOG_TABLE[parent_visits] if parent_visits < len(LOG_TABLE) else log(parent_visits)
+
+            if np is not None and len(child_ids) >= vector_min_children:
+                # Calculate UCT factor for all children at once
+                child_wins = np.array([wins[child] for child in child_ids], dtype=float)
+                child_visits = np.array([visits[child] for child in child_ids], dtype=float)
+                ratio = child_wins / child_visits
+                exploit = ratio if is_my_turn else 1 - ratio
+                uct = exploit + explore_faction * np.sqrt(log_visits / child_visits)
+
+                current = child_ids[int(np.argmax(uct))]
+            else:
+                # Keep the first child with the highest UCT factor, ties need no random pick
+                best_child, best_uct = -1, float('-inf')
+                for child in child_ids:
+                    # Calculate UCT factor for child
+                    child_visits = visits[child]
+                    exploit_term = wins[child] / child_visits
+                    explore_term = explore_faction * (log_visits / child_visits) ** 0.5
+                    uct = (exploit_term if is_my_turn else (1 - exploit_term)) + explore_term
+
+                    if uct > best_uct:
+                        best_child, best_uct = child, uct
+
+                current = best_child
+
+            current_state = pool.state[current]
+            path.append(current)
 
     # Return best_child/ending node
-    return current, current_state
+    return pool.node(current), current_state, path
 
 
 def expand_leaf(node, board, state):
@@ -58,17 +114,22 @@ def expand_leaf(node, board, state):
         node:   The node for which a child will be added.
         state:  The state of the game.
 
-    Returns:    The added child node.
+    Returns:    The added child node, shared with the other parents of its state if that state is already in the tree.
 
     """
 
     # Choose a random action from untried_actions
     chosen_action = choice(node.untried_actions)
-    child = MCTSNode(parent=node, parent_action=chosen_action, action_list=board.legal_actions(board.next_state(state,chosen_action)))
+    child_state = board.next_state(state, chosen_action)
+
+    # Reuse the node of a state already reached by another move order
+    if child_state in node.pool.transposition:
+        child = node.pool.add_edge(node.id, chosen_action, node.pool.transposition[child_state])
+    else:
+        child = node.pool.add_node(parent=node.id, parent_action=chosen_action, action_list=board.legal_actions(child_state), state=child_state)
 
     # Update node fields
     node.untried_actions.remove(chosen_action)
-    node.child_nodes[chosen_action] = child
 
     return child
 
@@ -81,88 +142,199 @@ def rollout(board, state, identity):
     Returns:    True if player won, False otherwise
 
     """
+    # Play out in compiled code when the board can be viewed as an array
+    if simulate_random is not None and board.as_array is not None:
+        return simulate_random(board.as_array(state), identity, random.getrandbits(32))
+
+    _choice = choice
+    _legal = board.legal_actions
+    _next = board.next_state
+    _ended = board.is_ended
     current_state = state
 
     # Play until end (win/lose)
-    while not board.is_ended(current_state):
-        move = choice(board.legal_actions(current_state))
-        current_state = board.next_state(current_state, move)
+    while not _ended(current_state):
+        current_state = _next(current_state, _choice(_legal(current_state)))
 
     # Return True if won, false otherwise
-    return True if board.points_values(current_state)[identity] == 1 else False
+    return board.points_values(current_state)[identity] == 1
 
-def backpropagate(node, won):
-    """ Navigates the tree from a leaf node to the root, updating the win and visit count of each node along the path.
+def rollout_leaves(board, leaves, identity):
+    """ Plays out the rollouts of several leaves at once.
 
     Args:
-        node:   A leaf node.
-        won:    An indicator of whether the bot won or lost the game.
+        board:      The game setup.
+        leaves:     A (state, number of rollouts) pair for each leaf.
+        identity:   The bot's player number, 1 or 2.
+
+    Returns:    The number of rollouts the bot won from each leaf.
 
     """
-    temp = node
-
-    # Traverse up the tree and update node wins/visits
-    while True:
-        node.wins += 1 if won else 0
-        node.visits += 1
-        node = node.parent
-        
-        if node == None:
-            break
+    # Play every rollout of the batch in one compiled call that spreads them over all cores
+    if batch_random is not None and board.as_array is not None:
+        states = np.array([board.as_array(state) for state, batch in leaves for _ in range(batch)])
+        seeds = np.array([random.getrandbits(32) for _ in range(len(states))], dtype=np.uint32)
+        results = batch_random(states, identity, seeds)
 
+        won, start = [], 0
+        for state, batch in leaves:
+            won.append(int(results[start:start + batch].sum()))
+            start += batch
+        return won
 
-def think(board, state):
-    """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
+    return [sum(rollout(board, state, identity) for _ in range(batch)) for state, batch in leaves]
+
+def add_virtual_loss(pool, path, pending):
+    """ Counts simulations still being played from a leaf as losses for whoever chose each node of its path, so
+    the following descents spread over other leaves instead of piling onto this one.
 
     Args:
-        board:  The game setup.
-        state:  The state of the game.
+        pool:       The pool holding the tree.
+        path:       The ids of the nodes from the root down to the leaf.
+        pending:    The number of simulations being played from the leaf.
+
+    """
+    wins, node_visits = pool.wins, pool.visits
+
+    for node in path:
+        node_visits[node] += pending
+
+    # The opponent chooses the nodes at even depths below the root, a loss for them is a win for the bot
+    for node in path[2::2]:
+        wins[node] += pending
 
-    Returns:    The action to be taken.
+
+def backpropagate(pool, path, won, virtual_loss):
+    """ Updates the win count of each node along the path from the root to a leaf node. The visits were already
+    counted by add_virtual_loss when the leaf was selected.
+
+    Args:
+        pool:           The pool holding the tree.
+        path:           The ids of the nodes from the root down to the leaf.
+        won:            The number of simulations the bot won.
+        virtual_loss:   The number of simulations add_virtual_loss counted for the path, which the result replaces.
 
     """
+    wins = pool.wins
 
-    # Initialize variables
-    identity_of_bot = board.current_player(state)
-    root_node = MCTSNode(parent=None, parent_action=None, action_list=board.legal_actions(state))
+    # Update node wins
+    for node in path:
+        wins[node] += won
 
-    for step in range(num_nodes):
-        # Copy the game for sampling a playthrough
-        sampled_game = state
+    # Take back the wins the virtual loss lent to the nodes the opponent chose
+    for node in path[2::2]:
+        wins[node] -= virtual_loss
 
-        # Start at root
-        node = root_node
 
-        # Traverse tree until leaf is reached, get new state
-        leaf, new_state = traverse_nodes(node, board, sampled_game, identity_of_bot)
+def _run_shard(board, state, identity, shard_size, seed, threads=1):
+    """ Builds an independent game tree from the given state. Each worker process of think runs one shard.
 
-        # If the reached leaf is not a game ending state, expand the tree
-        if not board.is_ended(new_state):
-            child = expand_leaf(leaf, board, new_state)
-            new_state = board.next_state(new_state, child.parent_action)
-        else:
-            child = leaf
+    Args:
+        board:      The game setup.
+        state:      The state of the game.
+        identity:   The bot's player number, 1 or 2.
+        shard_size: The number of simulations to run on this tree.
+        seed:       The seed for this worker's random number generator.
+        threads:    The number of cores this tree's rollouts may use.
+
+    Returns:    An action -> (wins, visits) dictionary of the root's children.
+
+    """
+    random.seed(seed)
+
+    # The other shards run beside this one, so the compiled rollouts only spread over this shard's cores
+    if set_num_threads is not None:
+        set_num_threads(max(1, min(threads, numba_config.NUMBA_NUM_THREADS)))
+
+    # A round plays a leaf per core, but never takes so much of the tree that its leaves are chosen from virtual
+    # losses alone
+    leaf_batch = max(1, min(max(min_leaf_batch, threads), shard_size // (rollout_batch * min_rounds)))
+
+    board = BoardFuncs.bind(board)
+    pool = NodePool(shard_size + 1)
+    root_node = pool.add_node(parent=None, parent_action=None, action_list=board.legal_actions(state), state=state)
+
+    step = 0
+    while step < shard_size:
+        paths, leaves = [], []
+
+        # Select a round of leaves before playing any of them out
+        while step < shard_size and len(leaves) < leaf_batch:
+            batch = min(rollout_batch, shard_size - step)
+            step += batch
+
+            # Copy the game for sampling a playthrough
+            sampled_game = state
+
+            # Start at root
+            node = root_node
+
+            # Traverse tree until leaf is reached, get new state
+            leaf, new_state, path = traverse_nodes(node, board, sampled_game, identity)
+
+            # If the reached leaf is not a game ending state, expand the tree
+            if not board.is_ended(new_state):
+                child = expand_leaf(leaf, board, new_state)
+                new_state = child.state
+                path.append(child.id)
 
-        # Simulate possible outcome for leaf
-        won = rollout(board, new_state, identity_of_bot)
+            # Count the visits right away, so the next descents of the round never meet an unvisited child and
+            # steer away from the rollouts still pending
+            add_virtual_loss(pool, path, batch)
+            paths.append(path)
+            leaves.append((new_state, batch))
+
+        # Simulate a batch of possible outcomes for every leaf of the round
+        won = rollout_leaves(board, leaves, identity)
 
         # Backpropogate simulation results
-        backpropagate(child, won)
+        for path, (_, batch), leaf_won in zip(paths, leaves, won):
+            backpropagate(pool, path, leaf_won, batch)
+
+    return {action: (child.wins, child.visits) for action, child in root_node.child_nodes.items()}
 
-    best_UCT = 0
-    best_children = []
 
-    # Choose best child depending on UCT calculation
-    for key, child in root_node.child_nodes.items():
-        child_UCT = child.wins / float(child.visits)
+def think(board, state):
+    """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
+    The simulations are split between independent trees that are searched in parallel processes and
+    whose root statistics are summed before choosing an action. Hosts that cannot fork search one tree.
 
-        if child_UCT == best_UCT:
-            best_children.append(child)
-        elif child_UCT > best_UCT:
-            best_children = [child]
-            best_UCT = child_UCT
+    Args:
+        board:  The game setup.
+        state:  The state of the game.
 
-    best_child = choice(best_children)
+    Returns:    The action to be taken.
+
+    """
+
+    # Initialize variables
+    identity_of_bot = board.current_player(state)
 
-    # print("MCTS vanilla picking {} with ratio {}".format(best_child.parent_action, best_UCT))
-    return best_child.parent_action
+    # Split the simulations evenly between the worker processes, without making any tree too small to search
+    num_shards = max(1, min(num_processes, num_nodes // min_shard_size))
+    if 'fork' not in get_all_start_methods():
+        num_shards = 1
+    shards = [num_nodes // num_shards + (1 if i < num_nodes % num_shards else 0) for i in range(num_shards)]
+    threads = max(1, num_processes // num_shards)
+    jobs = [(board, state, identity_of_bot, shard_size, random.getrandbits(32), threads) for shard_size in shards]
+
+    if len(jobs) == 1:
+        results = [_run_shard(*jobs[0])]
+    else:
+        results = _get_worker_pool(len(jobs)).starmap(_run_shard, jobs)
+
+    # Sum the wins/visits of every tree per root action
+    totals = {}
+    for result in results:
+        for action, (wins, visits) in result.items():
+            total_wins, total_visits = totals.get(action, (0, 0))
+            totals[action] = (total_wins + wins, total_visits + visits)
+
+    # Choose best action depending on UCT calculation
+    best_action, best_UCT = None, float('-inf')
+    for action, (wins, visits) in totals.items():
+        if wins / visits > best_UCT:
+            best_action, best_UCT = action, wins / visits
+
+    # print("MCTS vanilla picking {} with ratio {}".format(best_action, best_UCT))
+    return best_action
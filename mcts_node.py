@@ -1,24 +1,122 @@
+class NodePool:
+    def __init__(self, size):
+        """ Preallocates storage for the nodes of one MCTS tree. Nodes are integer ids into parallel lists, which
+        keeps the per-node lookups of the search plain list indexing instead of attribute loads.
 
+        Args:
+            size:   The maximum number of nodes in the tree.
 
-class MCTSNode:
-    def __init__(self, parent=None, parent_action=None, action_list=[]):
-        """ Initializes the tree node for MCTS. The node stores links to other nodes in the tree (parent and child
-        nodes), as well as keeps track of the number of wins and total simulations that have visited the node.
+        """
+        self.wins = [0] * size                  # Total wins of all paths through each node.
+        self.visits = [0] * size                # Number of times each node has been visited.
+        self.parent = [-1] * size               # Parent id of each node - -1 for the root node.
+
+        self.parent_action = [None] * size      # The move that got us to each node
+        self.state = [None] * size              # The game state at each node
+        self.children = [None] * size           # Action -> child id dictionary of each node
+        self.child_ids = [None] * size          # Child ids of each node in expansion order
+        self.untried_actions = [None] * size    # Yet unexplored actions of each node
+
+        # State -> node id, so move orders reaching the same state share one node and its statistics
+        self.transposition = {}
+
+        self.size = 0                           # Number of nodes in use
+
+    def add_node(self, parent=None, parent_action=None, action_list=[], state=None):
+        """ Allocates a new node and links it to its parent.
 
         Args:
-            parent:         The parent node of this node.
+            parent:         The id of the parent node, None for the root node.
             parent_action:  The action taken from the parent node that transitions the state to this node.
             action_list:    The list of legal actions to be considered at this node.
+            state:          The state of the game at this node, registered in the transposition table.
+
+        Returns:    The new node.
 
         """
-        self.parent = parent                    # Parent node to this node
-        self.parent_action = parent_action      # The move that got us to this node - "None" for the root node.
+        node_id = self.size
+        self.size += 1
+
+        self.parent_action[node_id] = parent_action
+        self.state[node_id] = state
+        self.children[node_id] = {}
+        self.child_ids[node_id] = []
+        self.untried_actions[node_id] = list(action_list)   # Copied, expanding the node must not mutate the caller's list
+
+        if state is not None:
+            self.transposition[state] = node_id
+
+        if parent is not None:
+            self.parent[node_id] = parent
+            self.add_edge(parent, parent_action, node_id)
+
+        return MCTSNode(self, node_id)
+
+    def add_edge(self, parent, parent_action, node_id):
+        """ Links an existing node as a child of another one. A node reached by several move orders keeps the first
+        parent and parent action it was created with.
+
+        Args:
+            parent:         The id of the parent node.
+            parent_action:  The action taken from the parent node that transitions the state to the child.
+            node_id:        The id of the child node.
+
+        Returns:    The child node.
+
+        """
+        self.child_ids[parent].append(node_id)
+        self.children[parent][parent_action] = node_id
+
+        return MCTSNode(self, node_id)
+
+    def node(self, node_id):
+        """ Returns a handle on the node with the given id. """
+        return MCTSNode(self, node_id)
+
+
+class MCTSNode:
+    __slots__ = ('pool', 'id')
+
+    def __init__(self, pool, node_id):
+        """ A handle on a node of a NodePool. The node stores links to other nodes in the tree (parent and child
+        nodes), as well as keeps track of the number of wins and total simulations that have visited the node.
+
+        Args:
+            pool:       The pool holding the node.
+            node_id:    The id of the node in the pool.
+
+        """
+        self.pool = pool
+        self.id = node_id
+
+    @property
+    def parent(self):
+        parent = self.pool.parent[self.id]
+        return None if parent < 0 else MCTSNode(self.pool, parent)
+
+    @property
+    def parent_action(self):
+        return self.pool.parent_action[self.id]
+
+    @property
+    def state(self):
+        return self.pool.state[self.id]
+
+    @property
+    def child_nodes(self):
+        return {action: MCTSNode(self.pool, child) for action, child in self.pool.children[self.id].items()}
+
+    @property
+    def untried_actions(self):
+        return self.pool.untried_actions[self.id]
 
-        self.child_nodes = {}                   # Action -> MCTSNode dictionary of children
-        self.untried_actions = action_list      # Yet unexplored actions
+    @property
+    def wins(self):
+        return self.pool.wins[self.id]
 
-        self.wins = 0                           # Total wins of all paths through this node.
-        self.visits = 0                         # Number of times this node has been visited.
+    @property
+    def visits(self):
+        return self.pool.visits[self.id]
 
     def __repr__(self):
         """
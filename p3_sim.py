@@ -1,3 +1,6 @@
+# Usage: python p3_sim.py <player 1> <player 2>, e.g. python p3_sim.py mcts_vanilla random_bot
+# The bots also run under PyPy (pypy3 p3_sim.py mcts_vanilla random_bot) without NumPy or Numba installed,
+# falling back to their pure-Python search and rollouts for the JIT to trace.
 import sys
 from timeit import default_timer as time
 import p3_t3
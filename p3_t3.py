@@ -18,6 +18,11 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+try:
+    import numpy as np
+except ImportError:
+    np = None   # Board.as_array needs NumPy, the bots check for it before calling it
+
 num_players = 2
 
 positions = dict(
@@ -183,6 +188,10 @@ class Board(object):
     def display_action(self, action):
         return self.unpack_action(action)
 
+    def as_array(self, state):
+        # Flat int16 copy of the state for compiled rollouts; an unconstrained next board is stored as -1.
+        return np.array([-1 if v is None else v for v in state], dtype=np.int16)
+
     def next_state(self, state, action):
         R, C, r, c = action
         player = state[-1]
@@ -195,7 +204,7 @@ class Board(object):
         updated_board = state[board_index + player_index]
 
         full = (state[board_index] | state[board_index + 1] == 0x1ff)
-        if any(updated_board & w == w for w in self.wins):
+        if has_line[updated_board]:
             state[18 + player_index] |= positions[(R, C)]
         elif full:
             state[18] |= positions[(R, C)]
@@ -240,23 +249,17 @@ class Board(object):
 
     def legal_actions(self, state):
         R, C = state[20], state[21]
-        Rset, Cset = (R,), (C,)
+        boards = [(R, C)]
         if R is None:
-            Rset, Cset = range(3), range(3)
+            boards = sub_boards
 
-        occupied = [
-            state[2 * x] | state[2 * x + 1] for x in range(9)
-        ]
         finished = state[18] | state[19]
 
         actions = [
             (R, C, r, c)
-            for R in Rset
-            for C in Cset
-            for r in range(3)
-            for c in range(3)
-            if not occupied[3 * R + C] & positions[(r, c)]
-            and not finished & positions[(R, C)]
+            for R, C in boards
+            if not finished & positions[(R, C)]
+            for r, c in free_cells[state[6 * R + 2 * C] | state[6 * R + 2 * C + 1]]
         ]
 
         return actions
@@ -271,9 +274,9 @@ class Board(object):
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
 
-        if any(w & p1 == w for w in self.wins):
+        if has_line[p1]:
             return True
-        if any(w & p2 == w for w in self.wins):
+        if has_line[p2]:
             return True
         if state[18] | state[19] == 0x1ff:
             return True
@@ -286,13 +289,20 @@ class Board(object):
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
 
-        if any(w & p1 == w for w in self.wins):
+        if has_line[p1]:
             return {1: 1, 2: 0}
-        if any(w & p2 == w for w in self.wins):
+        if has_line[p2]:
             return {1: 0, 2: 1}
         if state[18] | state[19] == 0x1ff:
             return {1: 0.5, 2: 0.5}
 
+    def box_closed_by(self, state, action):
+        # True if the action wins its sub-board for the player making it.
+        R, C, r, c = action
+        player = state[-1]
+        updated_board = state[2 * (3 * R + C) + player - 1] | positions[(r, c)]
+        return has_line[updated_board]
+
     def owned_boxes(self, state):
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
@@ -313,9 +323,9 @@ class Board(object):
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
 
-        if any(w & p1 == w for w in self.wins):
+        if has_line[p1]:
             return {1: 1, 2: -1}
-        if any(w & p2 == w for w in self.wins):
+        if has_line[p2]:
             return {1: -1, 2: 1}
         if state[18] | state[19] == 0x1ff:
             return {1: 0, 2: 0}
@@ -326,3 +336,12 @@ class Board(object):
         if value == 0.5:
             return "Draw."
         return "Winner: Player {0}.".format(winner)
+
+
+# The (R, C) sub-boards in the order legal_actions lists them
+sub_boards = sorted(positions)
+
+# Lookups over every 9-bit board bitmask: whether it holds three in a
+# row, and the (r, c) cells it leaves free in row-major order
+has_line = [any(mask & w == w for w in Board.wins) for mask in range(0x200)]
+free_cells = [[P for P in sorted(positions) if not mask & positions[P]] for mask in range(0x200)]
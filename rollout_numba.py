@@ -0,0 +1,199 @@
+
+import numpy as np
+from numba import njit, prange
+
+# A state is the p3_t3 state tuple flattened into an int16 array (see Board.as_array):
+#   [0, 18)  the player 1 / player 2 bitmask of each of the 9 sub-boards
+#   18, 19   the bitmask of sub-boards won (or drawn) by player 1 / player 2
+#   20, 21   the row and column of the sub-board to play in, -1 if unconstrained
+#   22       the player to move
+# A move is encoded as 9 * (3 * R + C) + (3 * r + c), which keeps the ordering of board.legal_actions.
+
+WINS = np.array([0x007, 0x038, 0x1c0, 0x049, 0x092, 0x124, 0x111, 0x054], dtype=np.int16)
+FULL = 0x1ff
+
+
+@njit(cache=True)
+def _has_line(mask):
+    for w in WINS:
+        if mask & w == w:
+            return True
+    return False
+
+
+@njit(cache=True)
+def legal_actions_nb(state):
+    """ Lists the legal moves of the given state.
+
+    Args:
+        state:  The state of the game.
+
+    Returns:    An array of encoded moves.
+
+    """
+    moves = np.empty(81, dtype=np.int16)
+    n = 0
+    finished = state[18] | state[19]
+    for board_index in range(9):
+        if state[20] >= 0 and board_index != 3 * state[20] + state[21]:
+            continue
+        if finished & (1 << board_index):
+            continue
+        occupied = state[2 * board_index] | state[2 * board_index + 1]
+        for cell in range(9):
+            if not occupied & (1 << cell):
+                moves[n] = 9 * board_index + cell
+                n += 1
+    return moves[:n]
+
+
+@njit(cache=True)
+def _apply(state, move):
+    # Plays the move on the state in place, mirroring Board.next_state
+    board_index, cell = move // 9, move % 9
+    player_index = state[22] - 1
+
+    state[22] = 3 - state[22]
+    state[2 * board_index + player_index] |= 1 << cell
+
+    if _has_line(state[2 * board_index + player_index]):
+        state[18 + player_index] |= 1 << board_index
+    elif state[2 * board_index] | state[2 * board_index + 1] == FULL:
+        state[18] |= 1 << board_index
+        state[19] |= 1 << board_index
+
+    if (state[18] | state[19]) & (1 << cell):
+        state[20], state[21] = -1, -1
+    else:
+        state[20], state[21] = cell // 3, cell % 3
+
+
+@njit(cache=True)
+def next_state_nb(state, move):
+    """ Returns a copy of the given state with the move played. """
+    new_state = state.copy()
+    _apply(new_state, move)
+    return new_state
+
+
+@njit(cache=True)
+def is_ended_nb(state):
+    """ Returns True if the game is over. """
+    p1 = state[18] & ~state[19]
+    p2 = state[19] & ~state[18]
+    return _has_line(p1) or _has_line(p2) or state[18] | state[19] == FULL
+
+
+@njit(cache=True)
+def points_nb(state):
+    """ Scores a finished game.
+
+    Args:
+        state:  The state of the game.
+
+    Returns:    An array indexed by player holding 1 for a win, -1 for a loss and 0 for a draw.
+
+    """
+    points = np.zeros(3, dtype=np.int8)
+    if _has_line(state[18] & ~state[19]):
+        points[1], points[2] = 1, -1
+    elif _has_line(state[19] & ~state[18]):
+        points[1], points[2] = -1, 1
+    return points
+
+
+@njit(cache=True)
+def _closes_box(state, move, identity):
+    # True if the move wins its sub-board for the given player
+    if state[22] != identity:
+        return False
+    board_index = move // 9
+    return _has_line(state[2 * board_index + identity - 1] | (1 << (move % 9)))
+
+
+@njit(cache=True, nogil=True)
+def simulate_random(state, identity, seed):
+    """ Plays the game out with uniformly random moves.
+
+    Args:
+        state:      The state of the game.
+        identity:   The bot's player number, 1 or 2.
+        seed:       The seed for the random number generator.
+
+    Returns:    True if the bot won, False otherwise.
+
+    """
+    np.random.seed(seed)
+    current_state = state.copy()
+
+    while not is_ended_nb(current_state):
+        moves = legal_actions_nb(current_state)
+        _apply(current_state, moves[np.random.randint(0, len(moves))])
+
+    return points_nb(current_state)[identity] == 1
+
+
+@njit(cache=True, nogil=True)
+def simulate_reasonable(state, identity, seed):
+    """ Plays the game out like mcts_modified.rollout: take the first move that wins a sub-board for the
+    player being scored, otherwise a random one.
+
+    Args:
+        state:      The state of the game.
+        identity:   The bot's player number, 1 or 2.
+        seed:       The seed for the random number generator.
+
+    Returns:    True if the bot won, False otherwise.
+
+    """
+    np.random.seed(seed)
+    current_state = state.copy()
+    current_identity = 1 if identity == 2 else 2
+
+    while not is_ended_nb(current_state):
+        moves = legal_actions_nb(current_state)
+        move = moves[np.random.randint(0, len(moves))]
+        for candidate in moves:
+            if _closes_box(current_state, candidate, current_identity):
+                move = candidate
+                break
+        _apply(current_state, move)
+        current_identity = 1 if current_identity == 2 else 2
+
+    return points_nb(current_state)[identity] == 1
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def batch_random(states, identity, seeds):
+    """ Plays out every row of states with simulate_random, spread over Numba's worker threads.
+
+    Args:
+        states:     The states of the game, one per row.
+        identity:   The bot's player number, 1 or 2.
+        seeds:      The seed of each playout.
+
+    Returns:    An array holding True for each playout the bot won.
+
+    """
+    results = np.empty(states.shape[0], dtype=np.bool_)
+    for i in prange(states.shape[0]):
+        results[i] = simulate_random(states[i], identity, seeds[i])
+    return results
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def batch_reasonable(states, identity, seeds):
+    """ Plays out every row of states with simulate_reasonable, spread over Numba's worker threads.
+
+    Args:
+        states:     The states of the game, one per row.
+        identity:   The bot's player number, 1 or 2.
+        seeds:      The seed of each playout.
+
+    Returns:    An array holding True for each playout the bot won.
+
+    """
+    results = np.empty(states.shape[0], dtype=np.bool_)
+    for i in prange(states.shape[0]):
+        results[i] = simulate_reasonable(states[i], identity, seeds[i])
+    return results